@@ -76,7 +76,10 @@ export default function(component) {
     const { parentElement, data, setStateValue } = component;
 
     console.log('Component function called');
-    console.log('Data received, features:', data.geojson ? data.geojson.features.length : 'none');
+
+    // GeoJSON arrives pre-serialized from Python; parse it once here
+    const geojson = typeof data.geojson === 'string' ? JSON.parse(data.geojson) : data.geojson;
+    console.log('Data received, features:', geojson ? geojson.features.length : 'none');
 
     // Extract overlay config
     const overlayConfig = data.overlay || {
@@ -104,6 +107,18 @@ export default function(component) {
     let confirmedGroup2 = null;
     let featureGroupMap = new Map();  // featureId -> 'group1' | 'group2'
 
+    // Tooltip number formatting (raw values arrive unformatted from Python)
+    const currencyFormat = new Intl.NumberFormat('en-US', { style: 'currency', currency: 'USD', minimumFractionDigits: 0, maximumFractionDigits: 0 });
+    const areaFormat = new Intl.NumberFormat('en-US', { minimumFractionDigits: 0, maximumFractionDigits: 0 });
+
+    function formatCurrency(value) {
+        return Number.isFinite(value) ? currencyFormat.format(value) : 'N/A';
+    }
+
+    function formatArea(value) {
+        return Number.isFinite(value) ? areaFormat.format(value) + ' sq ft' : 'N/A';
+    }
+
     // Color constants for selection outlines
     const SELECTION_COLORS = {
         individual: '#000000',   // Black
@@ -221,7 +236,7 @@ export default function(component) {
         }
 
         console.log('MapLibre GL loaded');
-        console.log('GeoJSON features:', data.geojson.features.length);
+        console.log('GeoJSON features:', geojson.features.length);
 
         // Initialize map (v2: pass the DOM element, not an ID string!)
         console.log('Creating MapLibre map instance...');
@@ -506,7 +521,7 @@ export default function(component) {
     function resetGroupMode() {
         // Clear visual states for all group features
         [...group1Features, ...group2Features].forEach(f => {
-            const feature = data.geojson.features.find(gf => gf.properties.feature_id === f.id);
+            const feature = geojson.features.find(gf => gf.properties.feature_id === f.id);
             if (feature) {
                 map.setFeatureState(
                     { source: 'parcels', id: feature.id },
@@ -533,7 +548,7 @@ export default function(component) {
     function clearAllSelections() {
         // Clear individual mode selections
         selectedFeatures.forEach(f => {
-            const feature = data.geojson.features.find(gf => gf.properties.feature_id === f.id);
+            const feature = geojson.features.find(gf => gf.properties.feature_id === f.id);
             if (feature) {
                 map.setFeatureState(
                     { source: 'parcels', id: feature.id },
@@ -656,7 +671,7 @@ export default function(component) {
             // Select with FIFO replacement
             if (selectedFeatures.length >= MAX_SELECTIONS) {
                 const oldestFeature = selectedFeatures.shift();
-                const oldFeature = data.geojson.features.find(f => f.properties.feature_id === oldestFeature.id);
+                const oldFeature = geojson.features.find(f => f.properties.feature_id === oldestFeature.id);
                 if (oldFeature) {
                     map.setFeatureState({ source: 'parcels', id: oldFeature.id }, { selected: false });
                 }
@@ -680,7 +695,7 @@ export default function(component) {
     function handleIndividualClear() {
         // Clear all individual mode selections
         selectedFeatures.forEach(f => {
-            const feature = data.geojson.features.find(gf => gf.properties.feature_id === f.id);
+            const feature = geojson.features.find(gf => gf.properties.feature_id === f.id);
             if (feature) {
                 map.setFeatureState({ source: 'parcels', id: feature.id }, { selected: false });
             }
@@ -791,18 +806,18 @@ export default function(component) {
         console.log('Adding parcel source...');
         map.addSource('parcels', {
             type: 'geojson',
-            data: data.geojson
+            data: geojson
         });
         console.log('Parcel source added');
 
-        // Fill layer with colors from properties (now CSS strings)
+        // Fill layer colored by the metric expression built in Python
         console.log('Adding fill layer...');
         map.addLayer({
             id: 'parcels-fill',
             type: 'fill',
             source: 'parcels',
             paint: {
-                'fill-color': ['get', 'fillColor'],
+                'fill-color': data.fill_color,
                 'fill-opacity': [
                     'case',
                     ['boolean', ['feature-state', 'selected'], false],
@@ -900,15 +915,15 @@ export default function(component) {
                 <b>${labelValue}</b><br/>
                 ${propertyClassLine}
                 ${propertyUseLine}
-                <b>Assessed Value:</b> ${props.display_total_value}<br/>
-                <b>Land Value:</b> ${props.display_land_value}<br/>
-                <b>Lot Size:</b> ${props.display_lot_size}<br/>
-                <b>Net Taxes:</b> ${props.display_net_taxes}<br/>
+                <b>Assessed Value:</b> ${formatCurrency(props.total_value)}<br/>
+                <b>Land Value:</b> ${formatCurrency(props.land_value)}<br/>
+                <b>Lot Size:</b> ${formatArea(props.lot_size)}<br/>
+                <b>Net Taxes:</b> ${formatCurrency(props.net_taxes)}<br/>
                 <hr style="margin: 5px 0; border: none; border-top: 1px solid rgba(255,255,255,0.3);"/>
-                <b>Net Taxes/sqft:</b> $${props.net_taxes_per_sqft.toFixed(2)}<br/>
+                <b>Net Taxes/sqft:</b> $${(props.net_taxes_per_sqft || 0).toFixed(2)}<br/>
                 ${cityStreetLine}
-                <b>Land Value/sqft:</b> $${props.land_value_per_sqft.toFixed(2)}<br/>
-                <b>Alignment Index:</b> ${props.alignment_index.toFixed(2)}<br/>
+                <b>Land Value/sqft:</b> $${(props.land_value_per_sqft || 0).toFixed(2)}<br/>
+                <b>Alignment Index:</b> ${(props.alignment_index || 0).toFixed(2)}<br/>
                 ${surfaceLines}
             `;
 
@@ -993,15 +1008,17 @@ polygon_map = st.components.v2.component(
 )
 
 
-def render_maplibre_map(geojson_data: dict, center: list, zoom: int, overlay_config: dict):
+def render_maplibre_map(geojson_data: str | dict, center: list, zoom: int, overlay_config: dict,
+                        fill_color: list | str):
     """
     Render MapLibre map component with parcel selection.
 
     Args:
-        geojson_data: GeoJSON FeatureCollection
+        geojson_data: GeoJSON FeatureCollection, preferably pre-serialized as a JSON string
         center: [lat, lon] for map center
         zoom: Initial zoom level
         overlay_config: Dict with display_name_field and overlay_type
+        fill_color: MapLibre fill-color expression (or color) for the features
 
     Returns:
         dict: Component value with selected_features
@@ -1011,7 +1028,8 @@ def render_maplibre_map(geojson_data: dict, center: list, zoom: int, overlay_con
             "geojson": geojson_data,
             "center": {"lat": center[0], "lon": center[1]},
             "zoom": zoom,
-            "overlay": overlay_config
+            "overlay": overlay_config,
+            "fill_color": fill_color
         },
         on_selected_features_change=lambda: None  # Required for v2 state capture
     )
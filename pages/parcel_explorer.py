@@ -1,9 +1,13 @@
+import re
+
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import altair as alt
 from streamlit_searchbox import st_searchbox
 
-from utils.db import get_connection, load_address_data
+from utils.db import get_connection, load_address_data, load_latest_year
 from utils.formatters import (
     format_currency,
     format_percentage,
@@ -29,26 +33,6 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
-def all_tokens_present(text: str, tokens: list[str]) -> bool:
-    """
-    Check if all search tokens appear in text in order.
-
-    Args:
-        text: The text to search within (lowercased)
-        tokens: List of search tokens (lowercased)
-
-    Returns:
-        True if all tokens found in order, False otherwise
-    """
-    pos = 0
-    for token in tokens:
-        pos = text.find(token, pos)
-        if pos == -1:
-            return False
-        pos += len(token)
-    return True
-
-
 def search_addresses(searchterm: str) -> list[tuple[str, str]]:
     """
     Search for addresses using token-based wildcard matching.
@@ -58,6 +42,9 @@ def search_addresses(searchterm: str) -> list[tuple[str, str]]:
 
     Example: "602 w" finds "602 W Washington Ave" but not "10 Maple Wood Ln"
 
+    The match runs as one Arrow regex kernel over the cached lowercase
+    address column, so no Python loop touches every address per keystroke.
+
     Args:
         searchterm: User's search input
 
@@ -68,53 +55,68 @@ def search_addresses(searchterm: str) -> list[tuple[str, str]]:
     if not searchterm or len(searchterm) < 2:
         return []
 
+    tokens = searchterm.lower().split()
+    if not tokens:
+        return []
+
     try:
         # Get cached address data (shared across all sessions)
         address_data = load_address_data(conn, SILVER_BUCKET)
-        tokens = searchterm.lower().split()
-
-        # Separate results by starts-with vs contains
-        starts_with = []
-        contains = []
-
-        for addr, pid in address_data:
-            addr_lower = addr.lower()
 
-            # Check if all search tokens appear in address (in order)
-            if all_tokens_present(addr_lower, tokens):
-                if addr_lower.startswith(tokens[0]):
-                    starts_with.append((addr, pid))
-                else:
-                    contains.append((addr, pid))
+        # All search tokens must appear in the address, in order
+        pattern = ".*".join(re.escape(token) for token in tokens)
+        matches = address_data.filter(pc.match_substring_regex(address_data['address_lower'], pattern))
 
-        # Combine results: starts-with first, then contains
-        results = starts_with + contains
+        # Starts-with results first, then contains (each keeps address order)
+        starts_with = pc.starts_with(matches['address_lower'], tokens[0])
+        results = pa.concat_tables([
+            matches.filter(starts_with),
+            matches.filter(pc.invert(starts_with)),
+        ]).slice(0, 100)
 
-        if not results:
+        if results.num_rows == 0:
             return [("No addresses found - try a different search", None)]
 
-        return results[:100]
+        return list(zip(results['full_address'].to_pylist(), results['parcel_id'].to_pylist()))
 
     except Exception as e:
         st.error(f"Error searching addresses: {e}")
         return []
 
+# Parcel fields read by this page (address parts, characteristics, values, metrics)
+PARCEL_COLUMNS = [
+    "parcel_id", "site_parcel_id", "parcel_year",
+    "full_address", "house_nbr", "street_dir", "street_name", "street_type", "unit",
+    "property_class", "property_use", "year_built", "bedrooms", "full_baths",
+    "half_baths", "total_living_area", "home_style",
+    "current_land_value", "current_improvement_value", "current_total_value",
+    "net_taxes", "lot_size", "land_share_property", "land_value_alignment_index",
+    "land_value_per_sqft_lot", "net_taxes_per_sqft_lot",
+]
+
+
 @st.cache_data(ttl=600)  # Cache for 10 minutes
 def load_parcel_data(_conn, parcel_id: str, silver_bucket: str) -> dict:
-    """Load complete parcel data including geometry for selected parcel."""
+    """Load the parcel fields this page displays for the selected parcel.
+
+    Only PARCEL_COLUMNS are read, so the wide parquet's other column chunks
+    are never fetched. COLUMNS() keeps whichever of them the file has, so a
+    field missing upstream still reads as absent rather than failing the query.
+    """
     if not parcel_id:
         return None
 
+    column_list = ", ".join(f"'{column}'" for column in PARCEL_COLUMNS)
     query = f"""
-    SELECT *
+    SELECT COLUMNS(lambda c: c IN ({column_list}))
     FROM read_parquet('{silver_bucket}/fact_parcels.parquet')
-    WHERE parcel_id = '{parcel_id.replace("'", "''")}'
+    WHERE parcel_id = ?
     ORDER BY parcel_year DESC
     LIMIT 1
     """
 
     try:
-        result = _conn.execute(query).fetchdf()
+        result = _conn.execute(query, [parcel_id]).fetchdf()
         return result.to_dict('records')[0] if len(result) > 0 else None
     except Exception as e:
         st.error(f"Error loading parcel data: {str(e)}")
@@ -126,6 +128,7 @@ def load_site_data(_conn, site_parcel_id: str, gold_bucket: str) -> dict:
     if not site_parcel_id:
         return None
 
+    parquet_path = f"{gold_bucket}/fact_sites.parquet"
     query = f"""
     SELECT
         net_taxes_per_sqft_lot,
@@ -133,16 +136,15 @@ def load_site_data(_conn, site_parcel_id: str, gold_bucket: str) -> dict:
         land_value_alignment_index,
         current_land_value,
         current_total_value
-    FROM read_parquet('{gold_bucket}/fact_sites.parquet')
-    WHERE site_parcel_id = '{site_parcel_id.replace("'", "''")}'
-    AND parcel_year = (
-        SELECT MAX(parcel_year)
-        FROM read_parquet('{gold_bucket}/fact_sites.parquet')
-    )
+    FROM read_parquet('{parquet_path}')
+    WHERE site_parcel_id = ?
+    AND parcel_year = ?
     """
 
     try:
-        result = _conn.execute(query).fetchdf()
+        # Latest year is cached separately so the lookup is a single scan
+        latest_year = load_latest_year(_conn, parquet_path, "parcel_year")
+        result = _conn.execute(query, [site_parcel_id, latest_year]).fetchdf()
         if len(result) > 0:
             site = result.to_dict('records')[0]
             # Calculate land_share_property if not directly available
@@ -185,26 +187,22 @@ def load_tax_roll_history(_conn, parcel_id: str, silver_bucket: str) -> pd.DataF
         city_tax,
         county_tax,
         school_tax,
-        matc_tax
+        matc_tax,
+        -- NULL (NaN in the DataFrame) when the assessed value is missing or non-positive
+        CASE WHEN total_assessed_value > 0
+            THEN net_tax / total_assessed_value * 100
+        END AS effective_tax_rate
     FROM read_parquet('{silver_bucket}/fact_tax_roll.parquet')
-    WHERE parcel_id = '{parcel_id.replace("'", "''")}'
+    WHERE parcel_id = ?
     ORDER BY tax_year
     """
 
     try:
-        result = _conn.execute(query).fetchdf()
+        result = _conn.execute(query, [parcel_id]).fetchdf()
 
         if len(result) == 0:
             return pd.DataFrame()
 
-        # Calculate effective_tax_rate with division by zero handling
-        result['effective_tax_rate'] = result.apply(
-            lambda row: (row['net_tax'] / row['total_assessed_value']) * 100
-            if pd.notna(row['total_assessed_value']) and row['total_assessed_value'] > 0
-            else None,
-            axis=1
-        )
-
         return result
 
     except Exception as e:
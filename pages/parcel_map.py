@@ -1,10 +1,13 @@
+import functools
+
 import streamlit as st
-import pandas as pd
-import json
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
-from utils.db import get_connection
-from utils.formatters import format_currency, format_number
+from utils.db import get_connection, load_latest_year
+from utils.formatters import format_currency, format_number, is_missing
+from utils.colors import magma_fill_color
 from components.glossary_dialog import render_glossary_button
 
 # Access shared state (initializes if needed)
@@ -65,51 +68,75 @@ COMPARISON_METRICS = [
     {"label": "People sqft/100sqft Vehicle",  "key": "people_to_vehicle_ratio_pct", "type": "number", "decimals": 1, "aggregate_only": True},
 ]
 
-# Magma colormap stops (normalized position, RGB) - reversed
-# Perceptually uniform gradient: light -> orange -> magenta -> purple -> dark
-MAGMA_STOPS = [
-    (0.0, [252, 253, 191]),
-    (0.25, [252, 143, 89]),
-    (0.5, [183, 55, 121]),
-    (0.75, [82, 22, 108]),
-    (1.0, [0, 0, 4]),
-]
+# Feature properties shipped to the component (property name -> source column).
+# Numeric sources missing from an overlay's table are sent as 0 (null for
+# NULLABLE_COLUMNS).
+FEATURE_PROPERTIES = {
+    "total_value": "current_total_value",
+    "land_value": "current_land_value",
+    "lot_size": "lot_size",
+    "net_taxes": "net_taxes",
+    "net_taxes_per_sqft": "net_taxes_per_sqft_lot",
+    "land_value_per_sqft": "land_value_per_sqft_lot",
+    "alignment_index": "land_value_alignment_index",
+}
+# Property classification (for parcels only)
+PARCEL_FEATURE_PROPERTIES = {
+    "property_class": "property_class",
+    "property_use": "property_use",
+}
+AGGREGATE_FEATURE_PROPERTIES = {
+    "taxes_per_city_street_sqft": "taxes_per_city_maint_street_sqft",
+    # Surface metrics (aggregate overlays only)
+    "vehicle_surface_per_du": "vehicle_surface_area_per_dwelling_unit",
+    "people_to_vehicle_ratio_pct": "people_to_vehicle_surface_ratio_pct",
+    # Components for correct group aggregation
+    "total_people_surface": "total_people_impervious_surface_area",
+    "total_vehicle_surface": "total_vehicle_impervious_surface_area",
+    "total_dwelling_units": "total_dwelling_units",
+}
+
+# Feature property the map shades for each metric column. These properties keep
+# missing values as null so the component can draw them gray.
+METRIC_PROPERTIES = {
+    column: name
+    for name, column in {**FEATURE_PROPERTIES, **AGGREGATE_FEATURE_PROPERTIES}.items()
+    if column in {m["column"] for m in METRICS.values()}
+}
 
+# Source columns whose missing values are sent as null rather than 0: metric
+# properties (drawn gray) and the values the tooltip shows as "N/A"
+NULLABLE_COLUMNS = set(METRIC_PROPERTIES) | {
+    FEATURE_PROPERTIES[name] for name in ("total_value", "land_value", "lot_size", "net_taxes")
+}
 
-def interpolate_magma_color(norm_val: float) -> list[int]:
-    """Interpolate RGB color from magma colormap based on normalized value (0-1)."""
-    # Find the two stops to interpolate between
-    for i in range(len(MAGMA_STOPS) - 1):
-        pos1, color1 = MAGMA_STOPS[i]
-        pos2, color2 = MAGMA_STOPS[i + 1]
-        if pos1 <= norm_val <= pos2:
-            # Linear interpolation between stops
-            t = (norm_val - pos1) / (pos2 - pos1)
-            return [
-                int(color1[0] + t * (color2[0] - color1[0])),
-                int(color1[1] + t * (color2[1] - color1[1])),
-                int(color1[2] + t * (color2[2] - color1[2])),
-            ]
-    # Fallback to last color
-    return list(MAGMA_STOPS[-1][1])
+# Decimal places kept in feature property values (the UI shows at most 2)
+FEATURE_VALUE_DECIMALS = 4
 
+# Decimal places kept in geometry coordinates (~0.1m at Madison's latitude)
+COORDINATE_DECIMALS = 6
 
-@st.cache_data(ttl=600)
-def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pd.DataFrame:
+@st.cache_resource(ttl=600)
+def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pa.Table:
     """Load map data for the selected overlay type.
 
+    Returned as an Arrow table so the cached value is stored as columnar
+    buffers rather than a pandas frame of Python objects. Arrow tables are
+    immutable, so cache_resource hands every caller the same table instead
+    of unpickling a copy (geometry included) on each cache hit.
+
     Args:
         _conn: DuckDB connection
         gold_bucket: GCS bucket path
         overlay_type: Key from OVERLAY_TYPES dict
 
     Returns:
-        DataFrame with geometry and metrics
+        Arrow table with geometry and metrics
     """
     # Validate overlay type
     if overlay_type not in OVERLAY_TYPES:
         st.error(f"Invalid overlay type: {overlay_type}")
-        return pd.DataFrame()
+        return pa.table({})
 
     overlay_config = OVERLAY_TYPES[overlay_type]
     label_field = overlay_config["label_field"]
@@ -130,7 +157,6 @@ def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pd.DataFrame:
         # Parcels: use current_ prefix columns
         value_columns = """
             current_land_value,
-            current_improvement_value,
             current_total_value,
             net_taxes,
             lot_size,
@@ -152,7 +178,6 @@ def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pd.DataFrame:
         # Aggregated overlays: use total_ prefix columns with aliases to normalize names
         value_columns = """
             total_land_value AS current_land_value,
-            total_improvement_value AS current_improvement_value,
             total_value AS current_total_value,
             total_net_taxes AS net_taxes,
             total_area AS lot_size,
@@ -163,7 +188,6 @@ def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pd.DataFrame:
         """
         # Surface metrics (only available at aggregated level)
         surface_columns = """
-            people_surface_area_per_dwelling_unit,
             vehicle_surface_area_per_dwelling_unit,
             people_to_vehicle_surface_ratio * 100 AS people_to_vehicle_surface_ratio_pct,
             total_people_impervious_surface_area,
@@ -173,10 +197,20 @@ def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pd.DataFrame:
         # No additional filters for aggregated overlays
         additional_filters = ""
 
+    # Latest year is cached separately so the main query is a single scan
+    try:
+        latest_year = load_latest_year(_conn, f"{gold_bucket}/{table}", year_column)
+    except Exception as e:
+        st.error(f"Error loading map data: {str(e)}")
+        return pa.table({})
+
+    # Trim coordinates to COORDINATE_DECIMALS places; the extra digits only bloat the payload
     query = f"""
     SELECT
         {select_clause}
-        geom_4326_geojson,
+        regexp_replace(
+            geom_4326_geojson, '(\\.\\d{{{COORDINATE_DECIMALS}}})\\d+', '\\1', 'g'
+        ) AS geom_4326_geojson,
         {value_columns}
         {city_street_columns}
         {surface_columns}
@@ -184,22 +218,19 @@ def load_map_data(_conn, gold_bucket: str, overlay_type: str) -> pd.DataFrame:
         land_value_per_sqft_lot,
         land_value_alignment_index
     FROM read_parquet('{gold_bucket}/{table}')
-    WHERE {year_column} = (
-        SELECT MAX({year_column})
-        FROM read_parquet('{gold_bucket}/{table}')
-    )
+    WHERE {year_column} = ?
     AND geom_4326_geojson IS NOT NULL
+    AND json_valid(geom_4326_geojson)
     {additional_filters}
     """
 
     try:
-        df = _conn.execute(query).fetchdf()
+        table = _conn.execute(query, [latest_year]).fetch_arrow_table()
         # Add metadata column for validation
-        df['overlay_type'] = overlay_type
-        return df
+        return table.append_column('overlay_type', pa.repeat(overlay_type, table.num_rows))
     except Exception as e:
         st.error(f"Error loading map data: {str(e)}")
-        return pd.DataFrame()
+        return pa.table({})
 
 
 @st.cache_data(ttl=600)
@@ -231,123 +262,112 @@ def load_parcel_filter_options(_conn, gold_bucket: str):
     return _conn.execute(query).df()
 
 
-def calculate_colors(values: np.ndarray) -> tuple[list, float, float]:
-    """
-    Calculate RGBA colors using percentile normalization.
-
-    Returns:
-        Tuple of (colors list, p2 value, p98 value)
+def calculate_percentile_bounds(_conn, table: pa.Table, metric: str) -> tuple[float, float] | None:
     """
-    # Use 2nd and 98th percentile to clip outliers
-    valid_values = values[~np.isnan(values)]
-    if len(valid_values) == 0:
-        return [[128, 128, 128, 100]] * len(values), 0, 0
-
-    p2, p98 = np.nanpercentile(valid_values, [2, 98])
-
-    # Handle edge case where p2 == p98
-    if p98 == p2:
-        p98 = p2 + 1
-
-    colors = []
-    for val in values:
-        if np.isnan(val):
-            colors.append([128, 128, 128, 100])  # Gray for missing
-        else:
-            # Normalize to 0-1, clipping outliers
-            norm_val = np.clip((val - p2) / (p98 - p2), 0, 1)
-            # Magma colormap: dark -> purple -> magenta -> orange -> light
-            rgb = interpolate_magma_color(norm_val)
-            colors.append([rgb[0], rgb[1], rgb[2], 180])
+    Compute the 2nd and 98th percentile of a metric with DuckDB.
 
-    return colors, p2, p98
-
-
-def colors_to_css(colors: list) -> list[str]:
-    """Convert RGBA color arrays to CSS rgba() strings for MapLibre."""
-    return [f"rgba({c[0]},{c[1]},{c[2]},{c[3]/255:.2f})" for c in colors]
-
-
-def format_metric_value(value, metric_config):
-    """
-    Format a metric value based on its type.
+    Runs an exact quantile_cont over the (already filtered) in-memory Arrow
+    table, so the aggregate is parallel and no filtered copy is built in
+    Python. Non-finite values (NaN, +/-inf from zero-area divisions) are
+    skipped so they can't become a bound in the fill-color expression. The
+    tables are small (a few dozen overlay rows up to ~80k parcels), and an
+    approximate sketch collapses to the min/max on the smallest ones. A
+    cursor is used because the connection is shared across sessions.
 
     Args:
-        value: Raw numeric value
-        metric_config: Dict with 'type' and 'decimals' keys
+        _conn: DuckDB connection
+        table: Arrow table with map data
+        metric: Metric column to compute bounds for
 
     Returns:
-        Formatted string
+        Tuple of (p2, p98), or None if the metric has no valid values; p98 is
+        bumped above p2 when they are equal, since color stops must increase
     """
-    if value is None or pd.isna(value):
-        return "N/A"
+    cursor = _conn.cursor()
+    try:
+        cursor.register("map_metric", table.select([metric]))
+        bounds = cursor.execute(f"""
+            SELECT quantile_cont(value, [0.02, 0.98])
+            FROM (SELECT CAST({metric} AS DOUBLE) AS value FROM map_metric)
+            WHERE isfinite(value)
+        """).fetchone()[0]
+    finally:
+        cursor.close()
+
+    if not bounds:
+        return None
+
+    p2, p98 = bounds
+    if p98 == p2:
+        p98 = p2 + 1
+    return p2, p98
 
-    metric_type = metric_config.get('type')
-    decimals = metric_config.get('decimals', 0)
 
+def _make_value_formatter(metric_type: str, decimals: int):
+    """Return a formatter for non-missing metric values of the given type."""
     if metric_type == 'currency':
-        if decimals == 0:
-            return format_currency(value)
-        else:
-            return f"${value:.{decimals}f}"
+        return format_currency if decimals == 0 else f"${{:.{decimals}f}}".format
     elif metric_type == 'area':
-        return f"{format_number(value, decimals=decimals)} sq ft"
+        return lambda value: f"{format_number(value, decimals=decimals)} sq ft"
     elif metric_type == 'number':
-        return format_number(value, decimals=decimals)
+        return lambda value: format_number(value, decimals=decimals)
     else:
-        return str(value)
+        return str
 
 
-def calculate_metric_delta(val1, val2, metric_config):
-    """
-    Calculate and format the difference between two metric values.
+def _make_delta_formatter(metric_type: str, decimals: int):
+    """Return a formatter (with +/- sign) for the difference between two metric values."""
+    if metric_type == 'currency':
+        body = format_currency if decimals == 0 else f"${{:.{decimals}f}}".format
+    elif metric_type == 'area':
+        body = lambda delta: f"{format_number(delta, decimals=decimals)} sq ft"
+    elif metric_type == 'number' and decimals == 0:
+        body = lambda delta: format_number(delta, decimals=decimals)
+    elif metric_type == 'number':
+        body = f"{{:.{decimals}f}}".format
+    else:
+        body = str
+    return lambda delta: f"{'+' if delta > 0 else ''}{body(delta)}"
 
-    Args:
-        val1: First value (baseline)
-        val2: Second value
-        metric_config: Dict with 'type' and 'decimals' keys
 
-    Returns:
-        Formatted delta string with +/- sign
-    """
-    if val1 is None or val2 is None or pd.isna(val1) or pd.isna(val2):
-        return "N/A"
+# Formatters keyed by (type, decimals), built once so comparison tables skip per-cell dispatch
+VALUE_FORMATTERS = {
+    (m["type"], m["decimals"]): _make_value_formatter(m["type"], m["decimals"]) for m in COMPARISON_METRICS
+}
+DELTA_FORMATTERS = {
+    (m["type"], m["decimals"]): _make_delta_formatter(m["type"], m["decimals"]) for m in COMPARISON_METRICS
+}
 
-    delta = val2 - val1
-    metric_type = metric_config.get('type')
-    decimals = metric_config.get('decimals', 0)
 
-    # Sign prefix
-    sign = "+" if delta > 0 else ""
+def _format_column(values: list, formatters: list) -> list[str]:
+    """Format one comparison column, with each value's formatter already resolved."""
+    return ["N/A" if is_missing(v) else fmt(v) for v, fmt in zip(values, formatters)]
 
-    if metric_type == 'currency':
-        if decimals == 0:
-            return f"{sign}{format_currency(delta)}"
-        else:
-            return f"{sign}${delta:.{decimals}f}"
-    elif metric_type == 'area':
-        return f"{sign}{format_number(delta, decimals=decimals)} sq ft"
-    elif metric_type == 'number':
-        if decimals == 0:
-            return f"{sign}{format_number(delta, decimals=decimals)}"
-        else:
-            return f"{sign}{delta:.{decimals}f}"
-    else:
-        return f"{sign}{delta}"
+
+def _format_deltas(values1: list, values2: list, formatters: list) -> list[str]:
+    """Format the difference column between two comparison columns."""
+    return [
+        "N/A" if is_missing(v1) or is_missing(v2) else fmt(v2 - v1)
+        for v1, v2, fmt in zip(values1, values2, formatters)
+    ]
 
 
-def build_comparison_dataframe(parcels: list, overlay_type: str) -> pd.DataFrame:
+def build_comparison_table(parcels: list, overlay_type: str) -> dict[str, list[str]]:
     """
-    Build a comparison dataframe with metrics as rows and features as columns.
+    Build a comparison table with metrics as rows and features as columns.
+
+    Returned as a dict of column lists that st.dataframe renders directly,
+    skipping a pandas DataFrame for a table this small.
 
     Args:
         parcels: List of feature dicts (0, 1, or 2 features)
         overlay_type: Current overlay type for column naming
 
     Returns:
-        DataFrame with:
-        - Index: Metric names
-        - Columns: Feature columns with difference if 2 features
+        Dict with:
+        - "Metric": Metric names
+        - Feature columns, plus difference if 2 features
+        Empty if the features can't be compared
     """
     num_parcels = len(parcels)
 
@@ -356,55 +376,40 @@ def build_comparison_dataframe(parcels: list, overlay_type: str) -> pd.DataFrame
         overlay_types = [p.get('overlay_type') for p in parcels]
         if len(set(overlay_types)) > 1:
             st.warning("⚠️ Cannot compare features from different overlay types. Please select features of the same type.")
-            return pd.DataFrame()
+            return {}
 
     # Filter out aggregate-only metrics for parcels overlay
     metrics_to_show = [m for m in COMPARISON_METRICS
                        if not (overlay_type == "parcels" and m.get("aggregate_only"))]
 
+    # Resolve formatters once per metric
+    value_formatters = [VALUE_FORMATTERS[(m["type"], m["decimals"])] for m in metrics_to_show]
+    delta_formatters = [DELTA_FORMATTERS[(m["type"], m["decimals"])] for m in metrics_to_show]
+
     # Build data dictionary
     data = {"Metric": [m["label"] for m in metrics_to_show]}
 
     if num_parcels >= 1:
         # Feature 1 column
-        feature1_values = []
-        for metric in metrics_to_show:
-            value = parcels[0]['properties'].get(metric['key'], None)
-            formatted = format_metric_value(value, metric)
-            feature1_values.append(formatted)
+        values1 = [parcels[0]['properties'].get(m['key'], None) for m in metrics_to_show]
 
         # Use label for column name (truncated if needed)
         label1 = parcels[0]['label']
         col1_name = label1[:30] + "..." if len(label1) > 30 else label1
-        data[col1_name] = feature1_values
+        data[col1_name] = _format_column(values1, value_formatters)
 
     if num_parcels == 2:
         # Feature 2 column
-        feature2_values = []
-        for metric in metrics_to_show:
-            value = parcels[1]['properties'].get(metric['key'], None)
-            formatted = format_metric_value(value, metric)
-            feature2_values.append(formatted)
+        values2 = [parcels[1]['properties'].get(m['key'], None) for m in metrics_to_show]
 
         label2 = parcels[1]['label']
         col2_name = label2[:30] + "..." if len(label2) > 30 else label2
-        data[col2_name] = feature2_values
+        data[col2_name] = _format_column(values2, value_formatters)
 
         # Difference column
-        diff_values = []
-        for metric in metrics_to_show:
-            val1 = parcels[0]['properties'].get(metric['key'], None)
-            val2 = parcels[1]['properties'].get(metric['key'], None)
-            delta = calculate_metric_delta(val1, val2, metric)
-            diff_values.append(delta)
-
-        data["Difference"] = diff_values
+        data["Difference"] = _format_deltas(values1, values2, delta_formatters)
 
-    # Create DataFrame with Metric as index
-    df = pd.DataFrame(data)
-    df.set_index('Metric', inplace=True)
-
-    return df
+    return data
 
 
 def render_group_comparison(payload: dict, overlay_type: str) -> None:
@@ -433,40 +438,26 @@ def render_group_comparison(payload: dict, overlay_type: str) -> None:
     metrics_to_show = [m for m in COMPARISON_METRICS
                        if not (overlay_type == "parcels" and m.get("aggregate_only"))]
 
+    # Resolve formatters once per metric
+    value_formatters = [VALUE_FORMATTERS[(m["type"], m["decimals"])] for m in metrics_to_show]
+    delta_formatters = [DELTA_FORMATTERS[(m["type"], m["decimals"])] for m in metrics_to_show]
+
     # Build data dictionary
     data = {"Metric": [m["label"] for m in metrics_to_show]}
 
     # Group 1 column
-    g1_values = []
-    for metric in metrics_to_show:
-        value = agg1.get(metric['key'], None)
-        formatted = format_metric_value(value, metric)
-        g1_values.append(formatted)
-    data[f"Group 1 (n={agg1.get('count', 0)})"] = g1_values
+    values1 = [agg1.get(m['key'], None) for m in metrics_to_show]
+    data[f"Group 1 (n={agg1.get('count', 0)})"] = _format_column(values1, value_formatters)
 
     # Group 2 column
-    g2_values = []
-    for metric in metrics_to_show:
-        value = agg2.get(metric['key'], None)
-        formatted = format_metric_value(value, metric)
-        g2_values.append(formatted)
-    data[f"Group 2 (n={agg2.get('count', 0)})"] = g2_values
+    values2 = [agg2.get(m['key'], None) for m in metrics_to_show]
+    data[f"Group 2 (n={agg2.get('count', 0)})"] = _format_column(values2, value_formatters)
 
     # Difference column
-    diff_values = []
-    for metric in metrics_to_show:
-        val1 = agg1.get(metric['key'], None)
-        val2 = agg2.get(metric['key'], None)
-        delta = calculate_metric_delta(val1, val2, metric)
-        diff_values.append(delta)
-    data["Difference"] = diff_values
-
-    # Create DataFrame
-    df = pd.DataFrame(data)
-    df.set_index('Metric', inplace=True)
+    data["Difference"] = _format_deltas(values1, values2, delta_formatters)
 
     # Display
-    st.dataframe(df, use_container_width=True)
+    st.dataframe(data, hide_index=True, use_container_width=True)
 
     # Show group details in expandable sections
     with st.expander(f"📋 Group 1 Details (n={agg1.get('count', 0)})"):
@@ -480,147 +471,205 @@ def render_group_comparison(payload: dict, overlay_type: str) -> None:
             st.write(", ".join([f.get('label', f.get('id', 'Unknown')) for f in features2]))
 
 
-def filter_dataframe(df: pd.DataFrame, overlay_type: str, area_plans: list, alder_districts: list,
-                     property_class: str, property_use: str) -> pd.DataFrame:
+def filter_map_data(table: pa.Table, overlay_type: str, area_plans: list, alder_districts: list,
+                    property_class: str, property_use: str) -> pa.Table:
     """
-    Filter DataFrame in-memory based on selected filter values.
+    Filter the map table in-memory based on selected filter values.
     Only applies to parcels overlay.
     """
     if overlay_type != "parcels":
-        return df
+        return table
 
     # Only filter if at least one filter has selections
     if not any([area_plans, alder_districts, property_class, property_use]):
-        return df
+        return table
 
-    filtered_df = df.copy()
+    # Combine the predicates into one mask so the table (geometry included)
+    # is materialized once, not once per filter
+    masks = []
 
     if area_plans:
-        filtered_df = filtered_df[filtered_df['area_plan_name'].isin(area_plans)]
+        masks.append(pc.is_in(table['area_plan_name'], value_set=pa.array(area_plans)))
 
     if alder_districts:
-        filtered_df = filtered_df[filtered_df['alder_district_name'].isin(alder_districts)]
+        masks.append(pc.is_in(table['alder_district_name'], value_set=pa.array(alder_districts)))
 
     if property_class:
-        filtered_df = filtered_df[filtered_df['property_class'] == property_class]
+        masks.append(pc.equal(table['property_class'], property_class))
 
     if property_use:
-        filtered_df = filtered_df[filtered_df['property_use'] == property_use]
+        masks.append(pc.equal(table['property_use'], property_use))
+
+    return table.filter(functools.reduce(pc.and_, masks))
 
-    return filtered_df
 
+def _feature_properties_sql(columns: list[str], overlay_type: str, display_field: str) -> str:
+    """
+    Build the json_object() argument list for a feature's properties.
 
-def build_geojson_maplibre(df: pd.DataFrame, metric: str, overlay_type: str) -> tuple[dict, float, float]:
-    """Build GeoJSON optimized for MapLibre with feature IDs and color properties.
+    Numeric values are rounded to FEATURE_VALUE_DECIMALS and missing ones
+    (NULL, NaN, +/-inf, or a column the overlay doesn't have) become 0,
+    matching what the component expects; non-finite values must not reach
+    json_object, which would emit bare NaN/Infinity that JSON.parse rejects.
+    NULLABLE_COLUMNS (metrics the map is shaded by and values the tooltip
+    shows as "N/A") keep missing values as null instead. Text values keep
+    NULL as null.
 
     Args:
-        df: DataFrame with map data
-        metric: Metric column to use for coloring
+        columns: Column names present in the map table
         overlay_type: Key from OVERLAY_TYPES dict
+        display_field: Property name the component uses for the feature label
 
     Returns:
-        Tuple of (GeoJSON dict, p2 value, p98 value)
+        Comma-separated key/value SQL expressions
     """
-    values = df[metric].values
-    colors, p2, p98 = calculate_colors(values)
-    css_colors = colors_to_css(colors)  # Convert to CSS strings
+    is_parcels = overlay_type == "parcels"
+    label_field = OVERLAY_TYPES[overlay_type]["label_field"]
+    # For parcels, features are identified by site_parcel_id
+    id_field = "site_parcel_id" if is_parcels else label_field
+
+    def numeric(column):
+        missing = "NULL" if column in NULLABLE_COLUMNS else "0"
+        if column not in columns:
+            return f"{missing}::DOUBLE"
+        value = f"CAST({column} AS DOUBLE)"
+        return f"round(CASE WHEN NOT isfinite({value}) THEN {missing} ELSE coalesce({value}, {missing}) END, {FEATURE_VALUE_DECIMALS})"
+
+    def text(column):
+        return column if column in columns else "NULL"
+
+    # Dynamic identifier fields
+    pairs = [
+        ("feature_id", id_field),
+        (display_field, label_field),
+        ("overlay_type", f"'{overlay_type}'"),
+    ]
+    # Raw values (numbers for comparison; the tooltip formats them client-side)
+    pairs += [(name, numeric(column)) for name, column in FEATURE_PROPERTIES.items()]
+    # Only ship fields the overlay actually has; the component treats
+    # missing ones as empty/0
+    if is_parcels:
+        pairs += [(name, text(column)) for name, column in PARCEL_FEATURE_PROPERTIES.items()]
+    else:
+        pairs += [(name, numeric(column)) for name, column in AGGREGATE_FEATURE_PROPERTIES.items()]
 
-    overlay_config = OVERLAY_TYPES[overlay_type]
-    label_field = overlay_config["label_field"]
-    display_field = overlay_config["display_name_field"]
+    return ", ".join(f"'{name}', {expr}" for name, expr in pairs)
 
-    features = []
-    for i, (_, row) in enumerate(df.iterrows()):
-        try:
-            geometry = json.loads(row['geom_4326_geojson'])
-        except (json.JSONDecodeError, TypeError):
-            continue
 
-        # Extract label value dynamically
-        label_value = row.get(label_field, "N/A")
+def build_geojson_maplibre(_conn, table: pa.Table, overlay_type: str) -> str:
+    """Build GeoJSON optimized for MapLibre with feature IDs.
 
-        # For parcels, also include site_parcel_id
-        if overlay_type == "parcels":
-            feature_id_value = row.get('site_parcel_id', label_value)
-        else:
-            feature_id_value = label_value
-
-        features.append({
-            "type": "Feature",
-            "id": i,  # Numeric ID for setFeatureState
-            "geometry": geometry,
-            "properties": {
-                # Dynamic identifier fields
-                "feature_id": feature_id_value,
-                display_field: label_value,
-                "overlay_type": overlay_type,
-
-                # Display values (formatted strings for tooltip)
-                "display_total_value": f"${row['current_total_value']:,.0f}" if pd.notna(row['current_total_value']) else "N/A",
-                "display_land_value": f"${row['current_land_value']:,.0f}" if pd.notna(row['current_land_value']) else "N/A",
-                "display_lot_size": f"{row['lot_size']:,.0f} sq ft" if pd.notna(row['lot_size']) else "N/A",
-                "display_net_taxes": f"${row['net_taxes']:,.0f}" if pd.notna(row['net_taxes']) else "N/A",
-
-                # Property classification (for parcels only)
-                "property_class": row.get('property_class', 'N/A') if overlay_type == "parcels" else None,
-                "property_use": row.get('property_use', 'N/A') if overlay_type == "parcels" else None,
-
-                # Raw values (numbers for comparison)
-                "total_value": float(row['current_total_value']) if pd.notna(row['current_total_value']) else 0,
-                "land_value": float(row['current_land_value']) if pd.notna(row['current_land_value']) else 0,
-                "lot_size": float(row['lot_size']) if pd.notna(row['lot_size']) else 0,
-                "net_taxes": float(row['net_taxes']) if pd.notna(row['net_taxes']) else 0,
-                "net_taxes_per_sqft": float(row['net_taxes_per_sqft_lot']) if pd.notna(row['net_taxes_per_sqft_lot']) else 0,
-                "taxes_per_city_street_sqft": float(row['taxes_per_city_maint_street_sqft']) if 'taxes_per_city_maint_street_sqft' in row and pd.notna(row['taxes_per_city_maint_street_sqft']) else 0,
-                "land_value_per_sqft": float(row['land_value_per_sqft_lot']) if pd.notna(row['land_value_per_sqft_lot']) else 0,
-                "alignment_index": float(row['land_value_alignment_index']) if pd.notna(row['land_value_alignment_index']) else 0,
-                # Surface metrics (aggregate overlays only)
-                "vehicle_surface_per_du": float(row['vehicle_surface_area_per_dwelling_unit']) if 'vehicle_surface_area_per_dwelling_unit' in row and pd.notna(row['vehicle_surface_area_per_dwelling_unit']) else 0,
-                "people_to_vehicle_ratio_pct": float(row['people_to_vehicle_surface_ratio_pct']) if 'people_to_vehicle_surface_ratio_pct' in row and pd.notna(row['people_to_vehicle_surface_ratio_pct']) else 0,
-                # Components for correct group aggregation
-                "total_people_surface": float(row['total_people_impervious_surface_area']) if 'total_people_impervious_surface_area' in row and pd.notna(row['total_people_impervious_surface_area']) else 0,
-                "total_vehicle_surface": float(row['total_vehicle_impervious_surface_area']) if 'total_vehicle_impervious_surface_area' in row and pd.notna(row['total_vehicle_impervious_surface_area']) else 0,
-                "total_dwelling_units": float(row['total_dwelling_units']) if 'total_dwelling_units' in row and pd.notna(row['total_dwelling_units']) else 0,
-
-                # Pre-computed color (CSS rgba string)
-                "fillColor": css_colors[i]
-            }
-        })
-
-    return {"type": "FeatureCollection", "features": features}, p2, p98
-
-
-def build_geojson(df: pd.DataFrame, metric: str) -> dict:
-    """Build GeoJSON FeatureCollection with colors based on selected metric."""
-    values = df[metric].values
-    colors, p2, p98 = calculate_colors(values)
-
-    features = []
-    for i, (_, row) in enumerate(df.iterrows()):
-        try:
-            geometry = json.loads(row['geom_4326_geojson'])
-        except (json.JSONDecodeError, TypeError):
-            continue
-
-        features.append({
-            "type": "Feature",
-            "geometry": geometry,
-            "properties": {
-                "site_parcel_id": row['site_parcel_id'],
-                "parcel_address": row['parcel_address'] or "N/A",
-                "current_total_value": f"{row['current_total_value']:,.0f}" if pd.notna(row['current_total_value']) else "N/A",
-                "current_land_value": f"{row['current_land_value']:,.0f}" if pd.notna(row['current_land_value']) else "N/A",
-                "current_improvement_value": f"{row['current_improvement_value']:,.0f}" if pd.notna(row['current_improvement_value']) else "N/A",
-                "lot_size": f"{row['lot_size']:,.0f}" if pd.notna(row['lot_size']) else "N/A",
-                "net_taxes": f"{row['net_taxes']:,.0f}" if pd.notna(row['net_taxes']) else "N/A",
-                "net_taxes_per_sqft_lot": f"{row['net_taxes_per_sqft_lot']:.2f}" if pd.notna(row['net_taxes_per_sqft_lot']) else "N/A",
-                "land_value_per_sqft_lot": f"{row['land_value_per_sqft_lot']:.2f}" if pd.notna(row['land_value_per_sqft_lot']) else "N/A",
-                "land_value_alignment_index": f"{row['land_value_alignment_index']:.2f}" if pd.notna(row['land_value_alignment_index']) else "N/A",
-                "color": colors[i],
-            }
-        })
-
-    return {"type": "FeatureCollection", "features": features}, p2, p98
+    The whole FeatureCollection is serialized by DuckDB over the in-memory Arrow
+    table: json_object for the properties, the stored GeoJSON text spliced in
+    for the geometry, and string_agg to join the features. The component
+    receives it as one string. Features carry raw metric values and MapLibre
+    colors them, so the same GeoJSON serves every metric.
+
+    Args:
+        _conn: DuckDB connection
+        table: Arrow table with (filtered) map data
+        overlay_type: Key from OVERLAY_TYPES dict
+
+    Returns:
+        GeoJSON FeatureCollection as a JSON string
+    """
+    display_field = OVERLAY_TYPES[overlay_type]["display_name_field"]
+    properties = _feature_properties_sql(table.column_names, overlay_type, display_field)
+
+    # Numeric ID (row position in the table) for setFeatureState
+    features = table.append_column("feature_row", pa.array(np.arange(table.num_rows)))
+
+    cursor = _conn.cursor()
+    try:
+        cursor.register("map_features", features)
+        return cursor.execute(f"""
+            SELECT '{{"type":"FeatureCollection","features":['
+                || string_agg(
+                    '{{"type":"Feature","id":' || feature_row
+                        || ',"geometry":' || geom_4326_geojson
+                        || ',"properties":' || json_object({properties})::VARCHAR || '}}',
+                    ',' ORDER BY feature_row
+                )
+                || ']}}'
+            FROM map_features
+        """).fetchone()[0]
+    finally:
+        cursor.close()
+
+
+# Each entry is a whole serialized FeatureCollection (tens of MB for parcels),
+# so only keep a handful of selections
+@st.cache_resource(ttl=600, max_entries=4, show_spinner=False)
+def build_map_geojson(_conn, gold_bucket: str, overlay_type: str, area_plans: list,
+                      alder_districts: list, property_class: str | None,
+                      property_use: str | None) -> tuple[str | None, int]:
+    """
+    Load, filter and build the map GeoJSON for one overlay/filter selection.
+
+    Cached as a whole so reruns that don't change the selection (metric
+    switches, other widget interactions, popover toggles) skip the build
+    entirely. The result is an immutable string, so cache_resource returns it
+    by reference rather than copying it out of a pickle on every hit.
+
+    Args:
+        _conn: DuckDB connection (not hashed by Streamlit)
+        gold_bucket: GCS bucket path
+        overlay_type: Key from OVERLAY_TYPES dict
+        area_plans: Area plan filter (parcels only)
+        alder_districts: Alder district filter (parcels only)
+        property_class: Property class filter (parcels only)
+        property_use: Property use filter (parcels only)
+
+    Returns:
+        Tuple of (GeoJSON string, feature count); the GeoJSON is None when
+        there are no features
+    """
+    map_data = load_map_data(_conn, gold_bucket, overlay_type)
+    if map_data.num_rows == 0:
+        return None, 0
+
+    # Apply in-memory filtering for parcels
+    map_data = filter_map_data(map_data, overlay_type, area_plans, alder_districts,
+                               property_class, property_use)
+    if map_data.num_rows == 0:
+        return None, 0
+
+    return build_geojson_maplibre(_conn, map_data, overlay_type), map_data.num_rows
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_metric_bounds(_conn, gold_bucket: str, overlay_type: str, metric: str, area_plans: list,
+                       alder_districts: list, property_class: str | None,
+                       property_use: str | None) -> tuple[float, float] | None:
+    """
+    Compute the color clipping bounds of a metric for one overlay/filter selection.
+
+    Args:
+        _conn: DuckDB connection (not hashed by Streamlit)
+        gold_bucket: GCS bucket path
+        overlay_type: Key from OVERLAY_TYPES dict
+        metric: Metric column the map is colored by
+        area_plans: Area plan filter (parcels only)
+        alder_districts: Alder district filter (parcels only)
+        property_class: Property class filter (parcels only)
+        property_use: Property use filter (parcels only)
+
+    Returns:
+        Tuple of (p2, p98), or None if the metric has no valid values
+    """
+    map_data = load_map_data(_conn, gold_bucket, overlay_type)
+    if map_data.num_rows == 0 or metric not in map_data.column_names:
+        return None
+
+    # Keep only the metric and filter columns so filtering doesn't copy the geometry
+    filter_columns = [column for column in ("area_plan_name", "alder_district_name",
+                                            "property_class", "property_use")
+                      if column in map_data.column_names]
+    map_data = filter_map_data(map_data.select([metric, *filter_columns]), overlay_type,
+                               area_plans, alder_districts, property_class, property_use)
+    if map_data.num_rows == 0:
+        return None
+    return calculate_percentile_bounds(_conn, map_data, metric)
 
 
 def get_filtered_options(df_combinations, selected_areas, selected_districts,
@@ -768,18 +817,20 @@ with st.sidebar:
         selected_property_use = None
 
 
-# Load data (cached by overlay type only)
-df = load_map_data(conn, GOLD_BUCKET, overlay_type)
-
-# Apply in-memory filtering for parcels
-if overlay_type == "parcels":
-    df = filter_dataframe(df, overlay_type, selected_area_plans, selected_alder_districts,
-                         selected_property_class, selected_property_use)
+# Load, filter and build the map (cached per overlay and filter selection)
+geojson_data, feature_count = build_map_geojson(
+    conn, GOLD_BUCKET, overlay_type, selected_area_plans,
+    selected_alder_districts, selected_property_class, selected_property_use
+)
 
-if not df.empty:
-    geojson_data, p2, p98 = build_geojson_maplibre(df, selected_metric, overlay_type)
+# The browser colors features by the metric; only its bounds depend on it
+metric_bounds = load_metric_bounds(
+    conn, GOLD_BUCKET, overlay_type, selected_metric, selected_area_plans,
+    selected_alder_districts, selected_property_class, selected_property_use
+)
+p2, p98 = metric_bounds or (0, 0)
 
-if df.empty:
+if feature_count == 0:
     st.warning("No data available. Please check the data source.")
 else:
 
@@ -805,7 +856,6 @@ else:
 
         # Update caption based on overlay type
         overlay_label = OVERLAY_TYPES[overlay_type]["label"]
-        feature_count = len(geojson_data['features'])
         st.caption(f"Showing {feature_count:,} {overlay_label.lower()}")
         st.info("Map may take a minute to load.")
 
@@ -830,7 +880,8 @@ else:
         geojson_data=geojson_data,
         center=[43.0731, -89.4012],  # Madison, WI [lat, lon]
         zoom=11,
-        overlay_config=overlay_config
+        overlay_config=overlay_config,
+        fill_color=magma_fill_color(METRIC_PROPERTIES[selected_metric], metric_bounds)
     )
 
     # Store selected parcels in session state
@@ -870,15 +921,15 @@ else:
 
                 # State 1: One feature selected
                 if num_selected == 1:
-                    df = build_comparison_dataframe(selected, overlay_type)
-                    if not df.empty:
-                        st.dataframe(df)
+                    comparison = build_comparison_table(selected, overlay_type)
+                    if comparison:
+                        st.dataframe(comparison, hide_index=True)
                     st.info(f"Select one more {overlay_label.lower()} to compare")
                     return
 
                 # State 2: Two features selected
-                df = build_comparison_dataframe(selected, overlay_type)
-                if not df.empty:
-                    st.dataframe(df)
+                comparison = build_comparison_table(selected, overlay_type)
+                if comparison:
+                    st.dataframe(comparison, hide_index=True)
 
         comparison_popover()
@@ -0,0 +1,56 @@
+"""Colormap helpers for shading map features by metric value."""
+
+
+# Magma colormap stops (normalized position, RGB) - reversed
+# Perceptually uniform gradient: light -> orange -> magenta -> purple -> dark
+MAGMA_STOPS = [
+    (0.0, [252, 253, 191]),
+    (0.25, [252, 143, 89]),
+    (0.5, [183, 55, 121]),
+    (0.75, [82, 22, 108]),
+    (1.0, [0, 0, 4]),
+]
+
+# Alpha for features with a value
+FEATURE_ALPHA = 180
+
+# RGBA used for features with no value for the selected metric
+MISSING_COLOR = [128, 128, 128, 100]
+
+
+def _css_rgba(r: int, g: int, b: int, a: int) -> str:
+    """Format an RGBA color (0-255 channels) as a CSS rgba() string for MapLibre."""
+    return f"rgba({r},{g},{b},{a / 255:.2f})"
+
+
+def magma_fill_color(property_name: str, bounds: tuple[float, float] | None) -> list | str:
+    """
+    Build a MapLibre fill-color expression shading features by a numeric property.
+
+    The magma stops are spread linearly between the 2nd and 98th percentile, so
+    MapLibre clamps outliers to the end colors just like percentile clipping.
+    Features without a value for the property are drawn gray.
+
+    Args:
+        property_name: Feature property holding the metric value
+        bounds: (p2, p98) clipping bounds with p98 > p2, or None if the metric
+            has no valid values
+
+    Returns:
+        MapLibre expression (or a plain color when there is nothing to shade)
+    """
+    missing_css = _css_rgba(*MISSING_COLOR)
+    if bounds is None:
+        return missing_css
+
+    p2, p98 = bounds
+    stops = []
+    for position, rgb in MAGMA_STOPS:
+        stops += [p2 + position * (p98 - p2), _css_rgba(*rgb, FEATURE_ALPHA)]
+
+    return [
+        "case",
+        ["==", ["get", property_name], None],
+        missing_css,
+        ["interpolate", ["linear"], ["get", property_name], *stops],
+    ]
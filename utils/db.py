@@ -2,6 +2,7 @@
 
 import streamlit as st
 import duckdb
+import pyarrow as pa
 
 
 @st.cache_resource
@@ -21,28 +22,70 @@ def get_duckdb_connection():
     conn.execute("""
         INSTALL httpfs;
         LOAD httpfs;
-        INSTALL spatial;
-        LOAD spatial;
     """)
 
-    # Create GCS secret (once for all sessions)
+    # Reuse parsed parquet footers across queries (entries are checked against
+    # the file's last-modified time, so refreshed files are re-read)
+    conn.execute("SET parquet_metadata_cache = true")
+
+    # Cache remote parquet footers/pages in memory across queries. This is a
+    # community extension, so fall back to plain httpfs if it isn't available.
+    try:
+        conn.execute("""
+            INSTALL cache_httpfs FROM community;
+            LOAD cache_httpfs;
+            SET cache_httpfs_type = 'in_mem';
+        """)
+    except duckdb.Error:
+        pass
+
+    # Create GCS secret (once for all sessions). Secret options are literals,
+    # not bindable parameters, so quote the values as SQL string literals.
+    key_id = st.secrets["gcs"]["key_id"].replace("'", "''")
+    secret = st.secrets["gcs"]["secret"].replace("'", "''")
     conn.execute(f"""
         CREATE SECRET gcs_secret (
             TYPE gcs,
-            KEY_ID '{st.secrets["gcs"]["key_id"]}',
-            SECRET '{st.secrets["gcs"]["secret"]}'
+            KEY_ID '{key_id}',
+            SECRET '{secret}'
         );
     """)
 
     return conn
 
 
-@st.cache_data(ttl=3600)  # Cache for 1 hour, shared across sessions
-def load_address_data(_conn, silver_bucket: str) -> list[tuple[str, str]]:
+@st.cache_data(ttl=600)  # Cache for 10 minutes, matching the data loaders that use it
+def load_latest_year(_conn, parquet_path: str, year_column: str) -> int:
+    """
+    Get the most recent year present in a parquet file.
+
+    The latest year only changes when the ETL refreshes the buckets, so it is
+    cached and bound as a query parameter instead of re-running a MAX()
+    subquery inside every data query.
+
+    Args:
+        _conn: DuckDB connection (not hashed by Streamlit)
+        parquet_path: Full path to the parquet file
+        year_column: Name of the year column
+
+    Returns:
+        Latest year value
+    """
+    query = f"""
+    SELECT MAX({year_column})
+    FROM read_parquet('{parquet_path}')
+    """
+    return _conn.execute(query).fetchone()[0]
+
+
+@st.cache_resource(ttl=3600)  # Cache for 1 hour, shared across sessions
+def load_address_data(_conn, silver_bucket: str) -> pa.Table:
     """
     Load parcel addresses for search functionality.
 
     This data is cached and shared across all user sessions for memory efficiency.
+    It is returned by reference (not unpickled per call) since every search
+    keystroke reads it; Arrow tables are immutable, so sharing it is safe.
     The underscore prefix on _conn tells Streamlit not to hash the connection object.
 
     Args:
@@ -50,16 +93,33 @@ def load_address_data(_conn, silver_bucket: str) -> list[tuple[str, str]]:
         silver_bucket: GCS bucket path for silver layer data
 
     Returns:
-        List of (full_address, parcel_id) tuples
+        Arrow table with full_address, parcel_id and address_lower columns,
+        sorted by address; the lowercase copy is built once here so searches
+        don't redo it per keystroke
     """
+    parquet_path = f"{silver_bucket}/fact_parcels.parquet"
+    latest_year = load_latest_year(_conn, parquet_path, "parcel_year")
+
     query = f"""
-    SELECT full_address, parcel_id
-    FROM read_parquet('{silver_bucket}/fact_parcels.parquet')
+    SELECT full_address, parcel_id, lower(full_address) AS address_lower
+    FROM read_parquet('{parquet_path}')
     WHERE full_address IS NOT NULL
-    AND parcel_year = (SELECT MAX(parcel_year) FROM read_parquet('{silver_bucket}/fact_parcels.parquet'))
+    AND parcel_year = ?
     ORDER BY full_address
     """
-    return _conn.execute(query).fetchall()
+    return _conn.execute(query, [latest_year]).fetch_arrow_table()
+
+
+@st.cache_resource
+def get_bucket_paths() -> tuple[str, str]:
+    """
+    Read the bucket paths from secrets once for the lifetime of the app.
+
+    Returns:
+        tuple: (silver_bucket, gold_bucket)
+    """
+    gcs_secrets = st.secrets["gcs"]
+    return gcs_secrets["silver_bucket"], gcs_secrets["gold_bucket"]
 
 
 def get_connection():
@@ -70,7 +130,6 @@ def get_connection():
         tuple: (conn, silver_bucket, gold_bucket)
     """
     conn = get_duckdb_connection()
-    silver_bucket = st.secrets["gcs"]["silver_bucket"]
-    gold_bucket = st.secrets["gcs"]["gold_bucket"]
+    silver_bucket, gold_bucket = get_bucket_paths()
 
     return conn, silver_bucket, gold_bucket
@@ -3,11 +3,25 @@
 import pandas as pd
 
 
+def is_missing(value) -> bool:
+    """Check for None/NaN, skipping pandas' type dispatch for plain numbers."""
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return value != value  # NaN is the only float not equal to itself
+    if isinstance(value, int):
+        return False
+    return pd.isna(value)
+
+
 def format_currency(value) -> str:
     """Format a numeric value as currency."""
-    if value is None or pd.isna(value):
+    if is_missing(value):
         return "N/A"
     try:
+        if isinstance(value, int):
+            # Integer grouping skips the int -> float conversion of ".0f"
+            return f"${value:,d}"
         return f"${value:,.0f}"
     except (ValueError, TypeError):
         return "N/A"
@@ -15,7 +29,7 @@ def format_currency(value) -> str:
 
 def format_percentage(value, decimals=1) -> str:
     """Format a numeric value as percentage."""
-    if value is None or pd.isna(value):
+    if is_missing(value):
         return "N/A"
     try:
         return f"{value:.{decimals}f}%"
@@ -25,10 +39,12 @@ def format_percentage(value, decimals=1) -> str:
 
 def format_number(value, decimals=0) -> str:
     """Format a numeric value with commas."""
-    if value is None or pd.isna(value):
+    if is_missing(value):
         return "N/A"
     try:
         if decimals == 0:
+            if isinstance(value, int):
+                return f"{value:,d}"
             return f"{value:,.0f}"
         else:
             return f"{value:,.{decimals}f}"
@@ -38,7 +54,7 @@ def format_number(value, decimals=0) -> str:
 
 def format_tax_change(current_taxes, shift_taxes) -> str:
     """Format tax change with arrow and dollar/percentage."""
-    if current_taxes is None or shift_taxes is None or pd.isna(current_taxes) or pd.isna(shift_taxes):
+    if is_missing(current_taxes) or is_missing(shift_taxes):
         return "N/A"
 
     try:
@@ -67,6 +83,11 @@ def format_address(parcel_data: dict) -> str:
     if not parcel_data:
         return "N/A"
 
+    # Prefer the address the silver layer already assembled (the same string
+    # address search shows); rebuild from the parts only if it is missing
+    if full_address := parcel_data.get('full_address'):
+        return full_address
+
     try:
         parts = []
 